@@ -15,16 +15,23 @@ from db import (
     get_meta,
     set_meta,
     replace_startups,
-    get_startups_df,
+    get_data_version,
+    get_startups_version,
+    get_user_version,
+    get_startups_stats,
+    get_distinct_values,
+    query_startups,
     get_startup_by_id,
     get_user_rating,
     upsert_rating,
     get_user_ratings_df,
     toggle_shortlist,
     get_user_shortlist_df,
+    get_user_shortlist_csv,
     get_leaderboard_df,
-    get_ratings_export_df,
-    get_shortlists_export_df,
+    get_ratings_export_csv,
+    get_shortlists_export_csv,
+    get_startups_export_csv,
 )
 from auth import verify_user, seed_default_users
 from utils import (
@@ -148,14 +155,18 @@ def explore_page():
     st.title("Startup Explorer")
     st.markdown("Filter startups and open a detailed profile to rate and shortlist.")
 
-    df = sanitize_dataframe(get_startups_df())
-    if df.empty:
+    version = get_startups_version()
+    stats = get_startups_stats(version)
+    if not stats["startup_count"]:
         st.info("No startups uploaded yet.")
         return
+    has_amounts = stats["amount_min"] is not None
+    amount_min = float(stats["amount_min"]) if has_amounts else 0.0
+    amount_max = float(stats["amount_max"]) if has_amounts else 1.0
 
     search = st.text_input("Search by name", key="explore_search")
-    sectors = sorted([x for x in df["sector"].dropna().unique()])
-    cities = sorted([x for x in df["city"].dropna().unique()])
+    sectors = get_distinct_values("sector", version)
+    cities = get_distinct_values("city", version)
 
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -163,73 +174,53 @@ def explore_page():
     with col2:
         city_filter = st.multiselect("City", cities, key="explore_city")
     with col3:
-        year_filter = st.multiselect("Year", sorted(df["year"].dropna().unique()), key="explore_year")
+        year_filter = st.multiselect("Year", get_distinct_values("year", version), key="explore_year")
     with col4:
         amount_range = st.slider(
             "Amount Range",
-            float(df["amount"].min()) if not df["amount"].isna().all() else 0.0,
-            float(df["amount"].max()) if not df["amount"].isna().all() else 1.0,
-            (float(df["amount"].min()) if not df["amount"].isna().all() else 0.0,
-             float(df["amount"].max()) if not df["amount"].isna().all() else 1.0),
+            amount_min,
+            amount_max,
+            (amount_min, amount_max),
             key="explore_amount",
         )
 
-    filtered = df.copy()
-    if search:
-        filtered = filtered[filtered["startup_name"].str.contains(search, case=False, na=False)]
-    if sector_filter:
-        filtered = filtered[filtered["sector"].isin(sector_filter)]
-    if city_filter:
-        filtered = filtered[filtered["city"].isin(city_filter)]
-    if year_filter:
-        filtered = filtered[filtered["year"].isin(year_filter)]
-    if not filtered["amount"].isna().all():
-        filtered = filtered[(filtered["amount"] >= amount_range[0]) & (filtered["amount"] <= amount_range[1])]
+    filtered = sanitize_dataframe(
+        query_startups(
+            search=search,
+            sectors=sector_filter,
+            cities=city_filter,
+            years=year_filter,
+            # Untouched bounds mean "any amount", which must keep startups without one.
+            amount_range=amount_range if has_amounts and tuple(amount_range) != (amount_min, amount_max) else None,
+        )
+    )
 
     st.markdown("<div class='section-header'>Results</div>", unsafe_allow_html=True)
-    def _display_amount(raw_json_value, numeric_value):
-        if raw_json_value:
-            try:
-                raw_data = json.loads(raw_json_value)
-            except json.JSONDecodeError:
-                raw_data = {}
-            for key in COLUMN_MAPPING["amount"]:
-                value = raw_data.get(key)
-                if value is not None and not (isinstance(value, float) and pd.isna(value)) and str(value).strip() != "":
-                    return str(value).strip()
-        if numeric_value is None or (isinstance(numeric_value, float) and pd.isna(numeric_value)):
-            return ""
-        return str(numeric_value)
-
-    display_df = filtered[["startup_name", "sector", "city", "year", "amount", "raw_json"]].copy()
-    display_df["amount"] = display_df.apply(
-        lambda row: _display_amount(row.get("raw_json"), row.get("amount")),
-        axis=1,
-    )
+    display_df = filtered[["startup_name", "sector", "city", "year", "amount_display"]]
     display_df = display_df.rename(
         columns={
             "startup_name": "Startup",
             "sector": "Sector",
             "city": "City",
             "year": "Year",
-            "amount": "Amount",
+            "amount_display": "Amount",
         }
     ).fillna("")
-    display_df = display_df[["Startup", "Sector", "City", "Year", "Amount"]]
     st.dataframe(display_df, use_container_width=True, hide_index=True)
 
     if filtered.empty:
         st.info("No startups match the filters.")
         return
 
+    startup_names = filtered["startup_name"].tolist()
     startup_choice = st.selectbox(
         "Select a startup for details",
-        filtered["startup_name"].tolist(),
+        startup_names,
         key="explore_startup_choice",
     )
-    selected = filtered[filtered["startup_name"] == startup_choice].iloc[0]
+    selected_id = filtered["id"].iat[startup_names.index(startup_choice)]
 
-    startup = get_startup_by_id(int(selected["id"]))
+    startup = get_startup_by_id(int(selected_id))
     if startup is None:
         st.error("Unable to load the startup details.")
         return
@@ -261,25 +252,23 @@ def explore_page():
         except TypeError:
             return st.container()
 
+    def _is_blank(value):
+        return value is None or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == ""
+
     def _raw_value(raw_data, keys):
         for key in keys:
             value = raw_data.get(key)
-            if value is not None and not (isinstance(value, float) and pd.isna(value)) and str(value).strip() != "":
+            if not _is_blank(value):
                 return value, key
         return None, None
 
-    raw_data = {}
-    if startup.get("raw_json"):
-        try:
-            raw_data = json.loads(startup["raw_json"])
-        except json.JSONDecodeError:
-            raw_data = {}
+    raw_data = startup.get("raw_data") or {}
 
     used_raw_keys = set()
 
     def _value_with_fallback(canonical, keys):
         value = startup.get(canonical)
-        if value is not None and not (isinstance(value, float) and pd.isna(value)) and str(value).strip() != "":
+        if not _is_blank(value):
             return value
         raw_value, raw_key = _raw_value(raw_data, keys)
         if raw_key:
@@ -343,17 +332,15 @@ def explore_page():
     exclude_keys.update(["notes", "summary", "description"])
     exclude_keys.update(used_raw_keys)
 
-    additional_items = {}
-    for key, value in raw_data.items():
-        if key in exclude_keys:
-            continue
-        if value is None or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == "":
-            continue
-        additional_items[key] = value
+    additional_items = {
+        key: value
+        for key, value in raw_data.items()
+        if key not in exclude_keys and not _is_blank(value)
+    }
 
     if additional_items:
         with st.expander("Additional Details"):
-            for key in sorted(additional_items.keys()):
+            for key in sorted(additional_items):
                 value = additional_items[key]
                 label = key.replace("_", " ").title()
                 if isinstance(value, (dict, list)):
@@ -397,7 +384,7 @@ def shortlist_page():
         hide_index=True,
     )
 
-    csv = df.to_csv(index=False)
+    csv = get_user_shortlist_csv(user["id"])
     st.download_button("Export CSV", csv, file_name="my_shortlist.csv", key="shortlist_export")
 
 
@@ -412,7 +399,7 @@ def ratings_page():
 
 def leaderboard_page():
     st.title("Leaderboard")
-    df = sanitize_dataframe(get_leaderboard_df())
+    df = sanitize_dataframe(get_leaderboard_df(get_data_version()))
     if df.empty:
         st.info("No ratings yet.")
         return
@@ -423,7 +410,7 @@ def leaderboard_page():
     chart_df = df.head(10).set_index("startup_name")
     st.bar_chart(chart_df[["avg_rating"]])
 
-    stats = get_user_stats(user["id"])
+    stats = get_user_stats(user["id"], get_user_version(user["id"]))
     st.markdown("<div class='section-header'>Your Stats</div>", unsafe_allow_html=True)
     col1, col2 = st.columns(2)
     with col1:
@@ -436,13 +423,10 @@ def admin_panel():
     st.title("Admin Panel")
     st.markdown("Download system exports for reporting.")
 
-    ratings_df = sanitize_dataframe(get_ratings_export_df())
-    shortlists_df = sanitize_dataframe(get_shortlists_export_df())
-    startups_df = sanitize_dataframe(get_startups_df())
-
-    st.download_button("Export Ratings", ratings_df.to_csv(index=False), file_name="ratings.csv", key="export_ratings")
-    st.download_button("Export Shortlists", shortlists_df.to_csv(index=False), file_name="shortlists.csv", key="export_shortlists")
-    st.download_button("Export Startups", startups_df.to_csv(index=False), file_name="startups_master.csv", key="export_startups")
+    version = get_data_version()
+    st.download_button("Export Ratings", get_ratings_export_csv(version), file_name="ratings.csv", key="export_ratings")
+    st.download_button("Export Shortlists", get_shortlists_export_csv(version), file_name="shortlists.csv", key="export_shortlists")
+    st.download_button("Export Startups", get_startups_export_csv(get_startups_version()), file_name="startups_master.csv", key="export_startups")
 
 
 if selection == "Upload Data":
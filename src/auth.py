@@ -1,13 +1,16 @@
-import bcrypt
-from db import get_connection
+from db import get_connection, transaction
 
 
 def hash_password(password):
+    import bcrypt
+
     password_bytes = password.encode("utf-8")
     return bcrypt.hashpw(password_bytes, bcrypt.gensalt()).decode("utf-8")
 
 
 def verify_password(password, password_hash):
+    import bcrypt
+
     try:
         return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
     except ValueError:
@@ -25,7 +28,7 @@ def verify_user(username, password):
 
 
 def seed_default_users():
-    with get_connection() as conn:
+    with transaction() as conn:
         count = conn.execute("SELECT COUNT(*) AS total FROM users").fetchone()["total"]
         if count > 0:
             return
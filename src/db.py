@@ -1,21 +1,165 @@
+import atexit
+import csv
+import io
+import json
+import logging
 import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import pandas as pd
+import streamlit as st
+from utils import COLUMN_MAPPING
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DB_PATH = os.path.join(BASE_DIR, "db", "jvl.db")
+STARTUP_SUMMARY_COLUMNS = "id, startup_name, sector, city, year, amount, amount_display"
+CSV_FETCH_SIZE = 1000
+FTS_MIN_QUERY_LENGTH = 3
+WRITE_BATCH_WINDOW = 0.05
+WRITE_RETRY_DELAY = 1.0
+CACHE_MAX_ENTRIES = 4
 
+USER_SHORTLIST_QUERY = """
+    SELECT s.startup_name, s.sector, s.city, s.year, s.amount, sh.created_at
+    FROM shortlists sh
+    JOIN startups s ON s.id = sh.startup_id
+    WHERE sh.user_id = ?
+    ORDER BY sh.created_at DESC
+"""
 
-def get_connection():
+BUMP_VERSION_SQL = """
+    INSERT INTO app_meta(key, value)
+    VALUES(?, '1')
+    ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+"""
+
+logger = logging.getLogger(__name__)
+
+_db_lock = threading.RLock()
+_pending_writes = []
+_pending_cond = threading.Condition()
+_writer_thread = None
+
+
+@st.cache_resource
+def _conn():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
     return conn
 
 
-def init_db():
+@contextmanager
+def get_connection():
+    # The connection is shared across Streamlit sessions, so serialise access to it.
+    with _db_lock:
+        conn = _conn()
+        _apply_pending_writes(conn)
+        yield conn
+
+
+def _enqueue_writes(statements):
+    global _writer_thread
+    with _pending_cond:
+        _pending_writes.append(statements)
+        if _writer_thread is None:
+            # Started from a script thread so the background thread never touches st.cache_resource.
+            _writer_thread = threading.Thread(target=_writer_loop, args=(_conn(),), name="db-writer", daemon=True)
+            _writer_thread.start()
+        _pending_cond.notify()
+
+
+def _apply_pending_writes(conn):
+    # Callers hold _db_lock, so queued writes always land before a read that follows them.
+    with _pending_cond:
+        batch = list(_pending_writes)
+        del _pending_writes[:]
+    if not batch:
+        return True
+    started = not conn.in_transaction
+    opened = False
+    try:
+        conn.execute("BEGIN" if started else "SAVEPOINT queued_batch")
+        opened = True
+        for statements in batch:
+            conn.execute("SAVEPOINT queued_write")
+            try:
+                for query, params in statements:
+                    conn.execute(query, params)
+            except sqlite3.OperationalError:
+                # Locking and I/O errors are transient; retry the whole batch later.
+                raise
+            except sqlite3.Error:
+                conn.execute("ROLLBACK TO queued_write")
+                logger.exception("Dropped a queued database write")
+            conn.execute("RELEASE queued_write")
+        conn.execute("COMMIT" if started else "RELEASE queued_batch")
+    except sqlite3.Error:
+        logger.exception("Failed to apply %d queued database writes; they will be retried", len(batch))
+        try:
+            if started:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            elif opened:
+                conn.execute("ROLLBACK TO queued_batch")
+                conn.execute("RELEASE queued_batch")
+        except sqlite3.Error:
+            logger.exception("Failed to roll back queued database writes")
+        with _pending_cond:
+            _pending_writes[:0] = batch
+        return False
+    return True
+
+
+def _writer_loop(conn):
+    while True:
+        with _pending_cond:
+            while not _pending_writes:
+                _pending_cond.wait()
+        time.sleep(WRITE_BATCH_WINDOW)
+        try:
+            with _db_lock:
+                applied = _apply_pending_writes(conn)
+        except Exception:
+            logger.exception("Database writer failed to apply queued writes")
+            applied = False
+        if not applied:
+            time.sleep(WRITE_RETRY_DELAY)
+
+
+def flush_writes():
+    if _pending_writes:
+        with get_connection():
+            pass
+
+
+atexit.register(flush_writes)
+
+
+@contextmanager
+def transaction(immediate=False):
     with get_connection() as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def init_db():
+    with transaction() as conn:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS startups (
@@ -30,10 +174,27 @@ def init_db():
                 source_link TEXT,
                 address TEXT,
                 contact TEXT,
-                raw_json TEXT
+                raw_json TEXT,
+                amount_display TEXT
+            )
+            """
+        )
+        _migrate_amount_display(conn)
+        fts_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'startups_fts'"
+        ).fetchone()
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS startups_fts USING fts5(
+                startup_name,
+                content='startups',
+                content_rowid='id',
+                tokenize='trigram'
             )
             """
         )
+        if not fts_exists:
+            _rebuild_startups_fts(conn)
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -72,6 +233,24 @@ def init_db():
             )
             """
         )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS startup_stats (
+                startup_id INTEGER PRIMARY KEY,
+                rating_sum INTEGER DEFAULT 0,
+                rating_count INTEGER DEFAULT 0
+            )
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO startup_stats(startup_id, rating_sum, rating_count)
+            SELECT startup_id, SUM(rating), COUNT(rating)
+            FROM ratings
+            WHERE NOT EXISTS (SELECT 1 FROM startup_stats)
+            GROUP BY startup_id
+            """
+        )
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS app_meta (
@@ -80,9 +259,42 @@ def init_db():
             )
             """
         )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_startups_sector ON startups(sector)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_startups_city ON startups(city)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_startups_year ON startups(year)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_startups_amount ON startups(amount)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_ratings_startup ON ratings(startup_id)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_shortlists_user ON shortlists(user_id)")
+        conn.execute("DROP INDEX IF EXISTS idx_ratings_user")
+        conn.execute("DROP INDEX IF EXISTS idx_shortlists_user")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ratings_user_startup ON ratings(user_id, startup_id, rating)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_shortlists_user_created ON shortlists(user_id, created_at DESC)"
+        )
+
+
+def _migrate_amount_display(conn):
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(startups)")}
+    if "amount_display" in columns:
+        return
+    conn.execute("ALTER TABLE startups ADD COLUMN amount_display TEXT")
+    raw_amounts = ", ".join(
+        "NULLIF(TRIM(json_extract(raw_json, '$.{}')), '')".format(key) for key in COLUMN_MAPPING["amount"]
+    )
+    conn.execute(
+        """
+        UPDATE startups
+        SET amount_display = COALESCE(
+            CASE WHEN json_valid(raw_json) THEN COALESCE({}) END,
+            CAST(amount AS TEXT)
+        )
+        """.format(raw_amounts)
+    )
+
+
+def _rebuild_startups_fts(conn):
+    conn.execute("INSERT INTO startups_fts(startups_fts) VALUES('rebuild')")
 
 
 def get_meta(key):
@@ -92,26 +304,57 @@ def get_meta(key):
 
 
 def set_meta(key, value):
-    with get_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO app_meta(key, value)
-            VALUES(?, ?)
-            ON CONFLICT(key) DO UPDATE SET value = excluded.value
-            """,
-            (key, value),
-        )
+    _enqueue_writes(
+        [
+            (
+                """
+                INSERT INTO app_meta(key, value)
+                VALUES(?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """,
+                (key, value),
+            )
+        ]
+    )
+
+
+def get_data_version():
+    return get_meta("data_version") or "0"
+
+
+def get_startups_version():
+    return get_meta("startups_version") or "0"
+
+
+def get_user_version(user_id):
+    return get_meta(_user_version_key(user_id)) or "0"
+
+
+def _user_version_key(user_id):
+    return "user_version_{}".format(user_id)
+
+
+def _bump_data_version(conn):
+    conn.execute(BUMP_VERSION_SQL, ("data_version",))
+
+
+def _version_bumps(user_id):
+    return [
+        (BUMP_VERSION_SQL, ("data_version",)),
+        (BUMP_VERSION_SQL, (_user_version_key(user_id),)),
+    ]
 
 
 def replace_startups(records):
-    with get_connection() as conn:
+    with transaction(immediate=True) as conn:
         conn.execute("DELETE FROM startups")
         conn.executemany(
             """
             INSERT INTO startups(
                 startup_name, sector, city, year, amount,
-                website, leadership, source_link, address, contact, raw_json
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                website, leadership, source_link, address, contact, raw_json,
+                amount_display
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(startup_name) DO UPDATE SET
                 sector = excluded.sector,
                 city = excluded.city,
@@ -122,9 +365,10 @@ def replace_startups(records):
                 source_link = excluded.source_link,
                 address = excluded.address,
                 contact = excluded.contact,
-                raw_json = excluded.raw_json
+                raw_json = excluded.raw_json,
+                amount_display = excluded.amount_display
             """,
-            [
+            (
                 (
                     r["startup_name"],
                     r.get("sector"),
@@ -137,22 +381,90 @@ def replace_startups(records):
                     r.get("address"),
                     r.get("contact"),
                     r.get("raw_json"),
+                    r.get("amount_display"),
                 )
                 for r in records
-            ],
+            ),
         )
+        _rebuild_startups_fts(conn)
+        conn.execute(BUMP_VERSION_SQL, ("startups_version",))
+        _bump_data_version(conn)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_startups_stats(version):
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) AS startup_count, MIN(amount) AS amount_min, MAX(amount) AS amount_max FROM startups"
+        ).fetchone()
+    return dict(row)
 
 
-def get_startups_df():
+# One entry per filter column for each startups version.
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES * 3)
+def get_distinct_values(column, version):
+    if column not in ("sector", "city", "year"):
+        raise ValueError("Unsupported filter column: {}".format(column))
+    query = "SELECT DISTINCT {0} FROM startups WHERE {0} IS NOT NULL ORDER BY {0}".format(column)
     with get_connection() as conn:
-        df = pd.read_sql_query("SELECT * FROM startups", conn)
+        rows = conn.execute(query).fetchall()
+    return [row[0] for row in rows]
+
+
+def query_startups(search=None, sectors=None, cities=None, years=None, amount_range=None):
+    clauses = []
+    params = []
+    if search and len(search) >= FTS_MIN_QUERY_LENGTH:
+        # Trigram tokens make a quoted phrase match any substring of the name.
+        clauses.append("id IN (SELECT rowid FROM startups_fts WHERE startups_fts MATCH ?)")
+        params.append('"{}"'.format(search.replace('"', '""')))
+    elif search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("startup_name LIKE '%' || ? || '%' ESCAPE '\\'")
+        params.append(escaped)
+    # Multiselects bind as one JSON array each, so the statement text (and the
+    # cached prepared statement) doesn't change with the number of selections.
+    if sectors:
+        clauses.append("sector IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(sectors)))
+    if cities:
+        clauses.append("city IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(cities)))
+    if years:
+        clauses.append("year IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(year) for year in years]))
+    if amount_range is not None:
+        clauses.append("amount BETWEEN ? AND ?")
+        params.extend(float(bound) for bound in amount_range)
+
+    query = "SELECT {} FROM startups".format(STARTUP_SUMMARY_COLUMNS)
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY id"
+    with get_connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
     return df
 
 
 def get_startup_by_id(startup_id):
     with get_connection() as conn:
         row = conn.execute("SELECT * FROM startups WHERE id = ?", (startup_id,)).fetchone()
-        return dict(row) if row else None
+        if not row:
+            return None
+        raw_rows = conn.execute(
+            """
+            SELECT j.key, j.value, j.type
+            FROM startups s,
+                 json_each(CASE WHEN json_valid(s.raw_json) THEN s.raw_json ELSE '{}' END) j
+            WHERE s.id = ?
+            """,
+            (startup_id,),
+        ).fetchall()
+    startup = dict(row)
+    startup["raw_data"] = {
+        r["key"]: r["type"] == "true" if r["type"] in ("true", "false") else r["value"] for r in raw_rows
+    }
+    return startup
 
 
 def get_user_rating(startup_id, user_id):
@@ -165,18 +477,37 @@ def get_user_rating(startup_id, user_id):
 
 
 def upsert_rating(startup_id, user_id, rating, comment):
-    with get_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO ratings(startup_id, user_id, rating, comment, updated_at)
-            VALUES(?, ?, ?, ?, ?)
-            ON CONFLICT(startup_id, user_id) DO UPDATE SET
-                rating = excluded.rating,
-                comment = excluded.comment,
-                updated_at = excluded.updated_at
-            """,
-            (startup_id, user_id, rating, comment, datetime.utcnow().isoformat()),
-        )
+    _enqueue_writes(
+        [
+            # Queued ahead of the rating upsert so the subqueries still see the previous rating.
+            (
+                """
+                INSERT INTO startup_stats(startup_id, rating_sum, rating_count)
+                VALUES(?, ?, 1)
+                ON CONFLICT(startup_id) DO UPDATE SET
+                    rating_sum = rating_sum + excluded.rating_sum - COALESCE(
+                        (SELECT rating FROM ratings WHERE startup_id = excluded.startup_id AND user_id = ?), 0
+                    ),
+                    rating_count = rating_count + NOT EXISTS(
+                        SELECT 1 FROM ratings WHERE startup_id = excluded.startup_id AND user_id = ?
+                    )
+                """,
+                (startup_id, rating, user_id, user_id),
+            ),
+            (
+                """
+                INSERT INTO ratings(startup_id, user_id, rating, comment, updated_at)
+                VALUES(?, ?, ?, ?, ?)
+                ON CONFLICT(startup_id, user_id) DO UPDATE SET
+                    rating = excluded.rating,
+                    comment = excluded.comment,
+                    updated_at = excluded.updated_at
+                """,
+                (startup_id, user_id, rating, comment, datetime.utcnow().isoformat()),
+            ),
+        ]
+        + _version_bumps(user_id)
+    )
 
 
 def toggle_shortlist(startup_id, user_id):
@@ -185,32 +516,39 @@ def toggle_shortlist(startup_id, user_id):
             "SELECT 1 FROM shortlists WHERE startup_id = ? AND user_id = ?",
             (startup_id, user_id),
         ).fetchone()
-        if exists:
-            conn.execute(
+    if exists:
+        statements = [
+            (
                 "DELETE FROM shortlists WHERE startup_id = ? AND user_id = ?",
                 (startup_id, user_id),
             )
-            return False
-        conn.execute(
-            "INSERT INTO shortlists(startup_id, user_id, created_at) VALUES (?, ?, ?)",
-            (startup_id, user_id, datetime.utcnow().isoformat()),
-        )
-        return True
+        ]
+    else:
+        statements = [
+            (
+                "INSERT OR IGNORE INTO shortlists(startup_id, user_id, created_at) VALUES (?, ?, ?)",
+                (startup_id, user_id, datetime.utcnow().isoformat()),
+            )
+        ]
+    _enqueue_writes(statements + _version_bumps(user_id))
+    return not exists
 
 
 def get_user_shortlist_df(user_id):
-    query = """
-        SELECT s.*, sh.created_at
-        FROM shortlists sh
-        JOIN startups s ON s.id = sh.startup_id
-        WHERE sh.user_id = ?
-        ORDER BY sh.created_at DESC
-    """
     with get_connection() as conn:
-        df = pd.read_sql_query(query, conn, params=(user_id,))
+        df = pd.read_sql_query(
+            USER_SHORTLIST_QUERY,
+            conn,
+            params=(user_id,),
+            dtype={"year": "Int32", "amount": "float64"},
+        )
     return df
 
 
+def get_user_shortlist_csv(user_id):
+    return stream_csv(USER_SHORTLIST_QUERY, (user_id,))
+
+
 def get_user_ratings_df(user_id):
     query = """
         SELECT s.startup_name, r.rating, r.comment, r.updated_at
@@ -224,15 +562,16 @@ def get_user_ratings_df(user_id):
     return df
 
 
-def get_leaderboard_df():
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_leaderboard_df(version):
     query = """
         SELECT s.startup_name,
-               AVG(r.rating) AS avg_rating,
-               COUNT(r.rating) AS rating_count
-        FROM ratings r
-        JOIN startups s ON s.id = r.startup_id
-        GROUP BY s.startup_name
-        ORDER BY avg_rating DESC, rating_count DESC
+               st.rating_sum * 1.0 / st.rating_count AS avg_rating,
+               st.rating_count
+        FROM startup_stats st
+        JOIN startups s ON s.id = st.startup_id
+        WHERE st.rating_count > 0
+        ORDER BY avg_rating DESC, st.rating_count DESC
     """
     with get_connection() as conn:
         df = pd.read_sql_query(query, conn)
@@ -241,27 +580,45 @@ def get_leaderboard_df():
     return df
 
 
-def get_ratings_export_df():
-    query = """
+def stream_csv(query, params=()):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    with get_connection() as conn:
+        cursor = conn.execute(query, params)
+        writer.writerow([column[0] for column in cursor.description])
+        rows = cursor.fetchmany(CSV_FETCH_SIZE)
+        while rows:
+            writer.writerows(rows)
+            rows = cursor.fetchmany(CSV_FETCH_SIZE)
+    return buffer.getvalue().encode("utf-8")
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_ratings_export_csv(version):
+    return stream_csv(
+        """
         SELECT r.*, s.startup_name, u.username
         FROM ratings r
         JOIN startups s ON s.id = r.startup_id
         JOIN users u ON u.id = r.user_id
         ORDER BY r.updated_at DESC
-    """
-    with get_connection() as conn:
-        df = pd.read_sql_query(query, conn)
-    return df
+        """
+    )
 
 
-def get_shortlists_export_df():
-    query = """
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_shortlists_export_csv(version):
+    return stream_csv(
+        """
         SELECT sh.*, s.startup_name, u.username
         FROM shortlists sh
         JOIN startups s ON s.id = sh.startup_id
         JOIN users u ON u.id = sh.user_id
         ORDER BY sh.created_at DESC
-    """
-    with get_connection() as conn:
-        df = pd.read_sql_query(query, conn)
-    return df
+        """
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_startups_export_csv(version):
+    return stream_csv("SELECT * FROM startups")
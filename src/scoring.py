@@ -1,14 +1,18 @@
+import streamlit as st
 from db import get_connection
 
+USER_STATS_MAX_ENTRIES = 64
 
-def get_user_stats(user_id):
+
+@st.cache_data(show_spinner=False, max_entries=USER_STATS_MAX_ENTRIES)
+def get_user_stats(user_id, version):
     with get_connection() as conn:
-        ratings_count = conn.execute(
-            "SELECT COUNT(*) AS total FROM ratings WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()["total"]
-        shortlist_count = conn.execute(
-            "SELECT COUNT(*) AS total FROM shortlists WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()["total"]
-    return {"ratings_count": ratings_count, "shortlist_count": shortlist_count}
+        row = conn.execute(
+            """
+            SELECT
+                (SELECT COUNT(*) FROM ratings WHERE user_id = ?) AS ratings_count,
+                (SELECT COUNT(*) FROM shortlists WHERE user_id = ?) AS shortlist_count
+            """,
+            (user_id, user_id),
+        ).fetchone()
+    return {"ratings_count": row["ratings_count"], "shortlist_count": row["shortlist_count"]}
@@ -1,5 +1,8 @@
 import json
+import os
 import re
+import numpy as np
+import orjson
 import pandas as pd
 import streamlit as st
 
@@ -16,50 +19,96 @@ COLUMN_MAPPING = {
     "contact": ["contact", "contact_details", "email", "phone"],
 }
 
+_VARIANT_TO_CANONICAL = {
+    variant: (canonical, rank)
+    for canonical, variants in COLUMN_MAPPING.items()
+    for rank, variant in enumerate(variants)
+}
 
-def load_css(path):
+AMOUNT_SCALES = {
+    "crore": 1e7,
+    "cr": 1e7,
+    "lakh": 1e5,
+    "lac": 1e5,
+    "million": 1e6,
+    "mn": 1e6,
+    "mil": 1e6,
+    "billion": 1e9,
+    "bn": 1e9,
+    "thousand": 1e3,
+    "k": 1e3,
+}
+AMOUNT_SUFFIXES = {"k": 1e3, "m": 1e6, "b": 1e9}
+
+_NON_ALNUM = re.compile(r"[^a-zA-Z0-9]+")
+_MULTI_UND = re.compile(r"_+")
+_YEAR = re.compile(r"((?:19|20)\d{2})")
+_WS = re.compile(r"\s+")
+_AMOUNT_WORD = re.compile(r"([0-9]+(?:\.[0-9]+)?)\s*(crore|cr|lakh|lac|million|mn|mil|billion|bn|thousand|k)\b")
+_AMOUNT_SUFFIX = re.compile(r"([0-9]+(?:\.[0-9]+)?)(k|m|b)\b")
+_NUM = re.compile(r"([0-9]+(?:\.[0-9]+)?)")
+_AMOUNT_SIMPLE = re.compile(
+    r"^([0-9]+(?:\.[0-9]+)?)(?: ?(crore|cr|lakh|lac|million|mn|mil|billion|bn|thousand|k)|(m|b))?$"
+)
+
+
+@st.cache_data(show_spinner=False)
+def _css_markup(path, mtime):
     with open(path, "r", encoding="utf-8") as handle:
-        css = handle.read()
-    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+        return f"<style>{handle.read()}</style>"
 
 
-def read_excel_file(uploaded_file):
-    return pd.read_excel(uploaded_file, engine="openpyxl")
+def load_css(path):
+    markup = _css_markup(path, os.path.getmtime(path))
+    if hasattr(st, "html"):
+        st.html(markup)
+    else:
+        st.markdown(markup, unsafe_allow_html=True)
 
 
-def normalize_column_name(name):
-    name = re.sub(r"[^a-zA-Z0-9]+", "_", name.strip().lower())
-    name = re.sub(r"_+", "_", name).strip("_")
-    return name
+def read_excel_file(uploaded_file):
+    try:
+        return pd.read_excel(uploaded_file, engine="calamine")
+    except ImportError:
+        if hasattr(uploaded_file, "seek"):
+            uploaded_file.seek(0)
+        return pd.read_excel(uploaded_file, engine="openpyxl")
 
 
 def normalize_columns(df):
     if df is None or df.empty:
         raise ValueError("Excel file is empty.")
 
-    normalized_columns = {}
-    seen = {}
-    for col in df.columns:
-        normalized = normalize_column_name(col)
-        count = seen.get(normalized, 0) + 1
-        seen[normalized] = count
-        if count > 1:
-            normalized = "{}_{}".format(normalized, count)
-        normalized_columns[col] = normalized
-
-    return df.rename(columns=normalized_columns)
+    names = (
+        df.columns.astype("string")
+        .str.strip()
+        .str.lower()
+        .str.replace(_NON_ALNUM, "_", regex=True)
+        .str.replace(_MULTI_UND, "_", regex=True)
+        .str.strip("_")
+    )
+    counts = names.to_series().groupby(names, dropna=False).cumcount().add(1).to_numpy()
+    new_columns = names.where(counts < 2, names + "_" + counts.astype(str))
+    if new_columns.equals(df.columns):
+        return df
+    return df.set_axis(new_columns, axis=1)
 
 
 def normalize_startup_df(df):
     df = normalize_columns(df)
 
-    for canonical, variants in COLUMN_MAPPING.items():
-        if canonical in df.columns:
+    matches = {}
+    for column in df.columns:
+        match = _VARIANT_TO_CANONICAL.get(column)
+        if match is None or match[0] in df.columns:
             continue
-        for variant in variants:
-            if variant in df.columns:
-                df[canonical] = df[variant]
-                break
+        canonical, rank = match
+        if canonical not in matches or rank < matches[canonical][0]:
+            matches[canonical] = (rank, column)
+    if matches:
+        df = df.assign(
+            **{canonical: df[matches[canonical][1]] for canonical in COLUMN_MAPPING if canonical in matches}
+        )
 
     if "startup_name" not in df.columns:
         raise ValueError("Missing required column: Startup")
@@ -67,115 +116,133 @@ def normalize_startup_df(df):
     return df
 
 
-def _to_int(value):
-    try:
-        if pd.isna(value):
-            return None
-        if isinstance(value, str):
-            match = re.search(r"(19|20)\\d{2}", value)
-            if match:
-                return int(match.group(0))
-        return int(value)
-    except (ValueError, TypeError):
-        return None
-
-
-def _to_float(value):
-    try:
-        if pd.isna(value):
-            return None
-        if isinstance(value, (int, float)):
-            return float(value)
-        if isinstance(value, str):
-            cleaned = value.replace(",", "").strip()
-            return float(cleaned)
-    except (ValueError, TypeError):
-        return None
-
-
-def _to_str(value):
-    if pd.isna(value):
-        return None
-    return str(value).strip() or None
-
-
-def _parse_amount(value):
-    if pd.isna(value):
-        return None
-    if isinstance(value, (int, float)):
-        return float(value)
-    text = str(value).lower().replace(",", " ").replace("$", "").replace("us$", "").replace("₹", " ")
-    text = re.sub(r"\\s+", " ", text).strip()
-
-    scale_map = {
-        "crore": 1e7,
-        "cr": 1e7,
-        "lakh": 1e5,
-        "lac": 1e5,
-        "million": 1e6,
-        "mn": 1e6,
-        "mil": 1e6,
-        "billion": 1e9,
-        "bn": 1e9,
-        "thousand": 1e3,
-        "k": 1e3,
+def _parse_amount_vec(s):
+    numeric = pd.to_numeric(s, errors="coerce")
+    pending = numeric.isna() & s.notna()
+    if not pending.any():
+        return numeric
+
+    codes, uniques = pd.factorize(s[pending])
+    text = (
+        pd.Series(uniques, dtype=object)
+        .astype("string")
+        .str.lower()
+        .str.replace(",", " ", regex=False)
+        .str.replace("$", "", regex=False)
+        .str.replace("₹", " ", regex=False)
+        .str.replace(_WS, " ", regex=True)
+        .str.strip()
+    )
+    # Most cells are a bare number or a number with one scale token; those resolve in a single anchored match.
+    simple = text.str.extract(_AMOUNT_SIMPLE)
+    scale = simple[1].map(AMOUNT_SCALES).fillna(simple[2].map(AMOUNT_SUFFIXES)).fillna(1.0)
+    parsed = pd.to_numeric(simple[0]).astype(float).mul(scale.astype(float)).to_numpy(dtype=float, na_value=np.nan, copy=True)
+
+    unresolved = np.isnan(parsed)
+    rest = text[unresolved]
+    if not rest.empty:
+        word_count = rest.str.count(_AMOUNT_WORD).fillna(0)
+        suffix_count = rest.str.count(_AMOUNT_SUFFIX).fillna(0)
+        word = rest.str.extract(_AMOUNT_WORD)
+        suffix = rest.str.extract(_AMOUNT_SUFFIX)
+        parsed[unresolved] = np.select(
+            [word_count.eq(1), word_count.gt(1), suffix_count.eq(1), suffix_count.gt(1)],
+            [
+                pd.to_numeric(word[0]).mul(word[1].map(AMOUNT_SCALES).astype(float)),
+                np.nan,
+                pd.to_numeric(suffix[0]).mul(suffix[1].map(AMOUNT_SUFFIXES).astype(float)),
+                np.nan,
+            ],
+            default=pd.to_numeric(rest.str.extract(_NUM, expand=False)),
+        )
+    return numeric.mask(pending, pd.Series(parsed[codes], index=s.index[pending]))
+
+
+def is_blank_series(s):
+    return (s.isna() | s.astype("string").str.strip().eq("")).astype(bool)
+
+
+def _coalesce_columns(df, keys):
+    result = pd.Series(None, index=df.index, dtype=object)
+    for key in keys:
+        if key in df.columns:
+            result = result.where(~is_blank_series(result), df[key])
+    return result
+
+
+def _resolve_columns(df):
+    resolved = {
+        canonical: _coalesce_columns(df, [canonical] + variants)
+        for canonical, variants in COLUMN_MAPPING.items()
     }
-
-    matches = re.findall(r"([0-9]+(?:\\.[0-9]+)?)\\s*(crore|cr|lakh|lac|million|mn|mil|billion|bn|thousand|k)\\b", text)
-    if len(matches) == 1:
-        number, scale = matches[0]
-        return float(number) * scale_map[scale]
-    if len(matches) > 1:
-        return None
-
-    suffix_matches = re.findall(r"([0-9]+(?:\\.[0-9]+)?)(k|m|b)\\b", text)
-    if len(suffix_matches) == 1:
-        number, suffix = suffix_matches[0]
-        suffix_map = {"k": 1e3, "m": 1e6, "b": 1e9}
-        return float(number) * suffix_map[suffix]
-    if len(suffix_matches) > 1:
-        return None
-
-    number_match = re.search(r"([0-9]+(?:\\.[0-9]+)?)", text)
-    if number_match:
-        return float(number_match.group(1))
-    return None
+    resolved["raw_amount"] = _coalesce_columns(df, COLUMN_MAPPING["amount"])
+    return pd.DataFrame(resolved, index=df.index)
+
+
+def _to_str_series(s):
+    text = s.astype("string").str.strip()
+    return text.mask(text.eq(""))
+
+
+def _to_low_cardinality_str_series(s):
+    if pd.api.types.infer_dtype(s, skipna=True) != "string":
+        return _to_str_series(s)
+    codes, uniques = pd.factorize(s)
+    labels = _to_str_series(pd.Series(uniques, dtype=object)).array
+    return pd.Series(labels.take(codes, allow_fill=True), index=s.index)
+
+
+def _to_int_series(s):
+    numeric = pd.to_numeric(s, errors="coerce")
+    pending = numeric.isna() & s.notna()
+    if pending.any():
+        years = s[pending].astype("string").str.extract(_YEAR, expand=False)
+        numeric = numeric.mask(pending, pd.to_numeric(years))
+    numeric = numeric.where(np.isfinite(numeric) & numeric.abs().lt(2**63))
+    return np.trunc(numeric).astype("Int64")
+
+
+def _vectorize_conversions(df):
+    resolved = _resolve_columns(df)
+    converted = pd.DataFrame(index=df.index)
+    converted["startup_name"] = _to_str_series(df["startup_name"])
+    for column in ("sector", "city"):
+        converted[column] = _to_low_cardinality_str_series(resolved[column])
+    for column in ("website", "leadership", "source_link", "address", "contact"):
+        converted[column] = _to_str_series(resolved[column])
+    converted["year"] = _to_int_series(resolved["year"])
+    converted["amount"] = _parse_amount_vec(resolved["raw_amount"])
+    converted["amount_display"] = _to_str_series(resolved["raw_amount"]).fillna(
+        converted["amount"].astype("string")
+    )
+    return converted.astype(object).where(converted.notna(), None)
+
+
+def _dump_payload(payload):
+    try:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+    except orjson.JSONEncodeError:
+        # orjson rejects integers beyond 64 bits; the stdlib encoder handles them.
+        return json.dumps(payload, default=str)
 
 
 def extract_startup_records(df):
-    records = []
-    for _, row in df.iterrows():
-        startup_name = _to_str(row.get("startup_name"))
-        if not startup_name:
-            continue
-        raw_payload = {k: None if pd.isna(v) else v for k, v in row.items()}
-        record = {
-            "startup_name": startup_name,
-            "sector": _to_str(row.get("sector")),
-            "city": _to_str(row.get("city")),
-            "year": _to_int(row.get("year")),
-            "amount": _parse_amount(row.get("amount")),
-            "website": _to_str(row.get("website")),
-            "leadership": _to_str(row.get("leadership")),
-            "source_link": _to_str(row.get("source_link")),
-            "address": _to_str(row.get("address")),
-            "contact": _to_str(row.get("contact")),
-        }
-        record["raw_json"] = json.dumps(raw_payload, ensure_ascii=True)
-        records.append(record)
-
-    if not records:
+    df = df.loc[(~is_blank_series(df["startup_name"])).to_numpy()]
+    if df.empty:
         raise ValueError("No valid startup records found.")
 
-    return records
+    converted = _vectorize_conversions(df)
+    payloads = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    converted["raw_json"] = [_dump_payload(payload) for payload in payloads]
+    return converted.to_dict(orient="records")
 
 
 def sanitize_dataframe(df, year_col="year", amount_col="amount"):
     if df is None or df.empty:
         return df
-    df = df.copy()
+    updates = {}
     if year_col in df.columns:
-        df[year_col] = pd.to_numeric(df[year_col], errors="coerce")
+        updates[year_col] = pd.to_numeric(df[year_col], errors="coerce")
     if amount_col in df.columns:
-        df[amount_col] = pd.to_numeric(df[amount_col], errors="coerce")
-    return df
+        updates[amount_col] = pd.to_numeric(df[amount_col], errors="coerce")
+    return df.assign(**updates) if updates else df
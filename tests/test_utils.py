@@ -0,0 +1,41 @@
+import pandas as pd
+
+from utils import _parse_amount_vec, _to_int_series, extract_startup_records, normalize_startup_df
+
+
+def test_parse_amount_single_value():
+    assert _parse_amount_vec(pd.Series(["5 crore"])).iloc[0] == 5e7
+
+
+def test_parse_amount_series():
+    values = pd.Series(["5 crore", "10 lakh", "$1.5M", "2 bn", "12m 13m", "undisclosed", None, 2500000], dtype=object)
+    parsed = _parse_amount_vec(values)
+    assert parsed.tolist()[:4] == [5e7, 1e6, 1.5e6, 2e9]
+    assert parsed.iloc[4:7].isna().all()
+    assert parsed.iloc[7] == 2500000
+
+
+def test_to_int_single_value():
+    assert _to_int_series(pd.Series(["Founded in 2019"])).iloc[0] == 2019
+
+
+def test_to_int_series():
+    values = pd.Series(["Founded in 2019", "2021", 2015.7, None, "n/a"], dtype=object)
+    years = _to_int_series(values)
+    assert years.iloc[:3].tolist() == [2019, 2021, 2015]
+    assert years.iloc[3:].isna().all()
+
+
+def test_extract_startup_records_parses_upload_columns():
+    df = pd.DataFrame(
+        {
+            "Startup": ["Alpha", "  "],
+            "Funding Amount": ["5 crore", "1 cr"],
+            "Year": ["Founded in 2019", 2020],
+        }
+    )
+    records = extract_startup_records(normalize_startup_df(df))
+    assert len(records) == 1
+    assert records[0]["amount"] == 5e7
+    assert records[0]["year"] == 2019
+    assert records[0]["amount_display"] == "5 crore"